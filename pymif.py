@@ -30,6 +30,79 @@ Python script for .mif .mid files parsing
 4326
 """
 
+import re
+from array import array
+
+# Типы геометрии, с которых начинается объект в секции DATA
+_GEOM_TYPES = ("point", "line", "pline", "region", "arc", "text", "rect", "roundrect", "ellipse", "multipoint", "collection", "none")
+# Типы геометрии, которые могут входить в collection
+_COLLECTION_TYPES = _GEOM_TYPES[:-1]
+
+def _iter_line_spans(text):
+    """Yields (start, end) offsets of non-empty lines of text"""
+    find = text.find
+    pos = 0
+    end = len(text)
+    while pos < end:
+        nl = find('\n', pos)
+        if nl == -1:
+            nl = end
+        if nl != pos:
+            yield pos, nl
+        pos = nl + 1
+
+def _iter_nonblank_lines(text):
+    """Yields non-empty lines of text without building the full list of lines"""
+    for start, end in _iter_line_spans(text):
+        yield text[start:end]
+
+# Строка из одного целого числа, в том виде, который принимает int()
+_INT_LINE_RE = re.compile(r'\s*[+-]?\d+\s*$')
+
+def _parse_points(lines):
+    """Splits every coordinate line into its values, one point per line"""
+    return [line.split() for line in lines]
+
+# Смещения строк хранятся в 64-битных массивах; в Python 2 нет типа 'q',
+# там используется 'l' (32 бита на Windows и 32-битных сборках)
+try:
+    array('q')
+    _OFFSET_TYPECODE = 'q'
+except ValueError:
+    _OFFSET_TYPECODE = 'l'
+
+class _Lines(object):
+    """
+    Non-empty lines of the text
+
+    Only line offsets are kept, line strings are sliced from the text on demand,
+    so the file text is not duplicated by a list of lines. Read-only: supports
+    len(), indexing, slicing and iteration, but not list methods
+    """
+    def __init__(self, text):
+        self._text = text
+        self._starts = array(_OFFSET_TYPECODE)
+        self._ends = array(_OFFSET_TYPECODE)
+        add_start = self._starts.append
+        add_end = self._ends.append
+        for start, end in _iter_line_spans(text):
+            add_start(start)
+            add_end(end)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            text = self._text
+            return [text[start:end] for start, end in zip(self._starts[index], self._ends[index])]
+        return self._text[self._starts[index]:self._ends[index]]
+
+    def __iter__(self):
+        text = self._text
+        for start, end in zip(self._starts, self._ends):
+            yield text[start:end]
+
 class Mif:
     """
     Getting data from the .mif file
@@ -38,6 +111,10 @@ class Mif:
     ----------
     file_mif : <String>
         Mif file text
+    lazy_lines : <Boolean>
+        keep only line offsets instead of a list of lines: uses less memory
+        for large files, but parsing is slower and .lines is a read-only
+        sequence instead of a list
 
     Methods
     ----------
@@ -49,15 +126,42 @@ class Mif:
     .getLineStarted(); \n
     .getGeometry(); \n
     """
-    def __init__(self, file_mif):
+    def __init__(self, file_mif, lazy_lines = False):
         self.file_mif = file_mif
-        self.lines = file_mif.split('\n')
-        for l in xrange(len(self.lines)):
-            if l >= len(self.lines):
-                break
-            line = self.lines[l]
-            if not line:
-                del self.lines[l]
+        if lazy_lines:
+            self.lines = _Lines(file_mif)
+        else:
+            self.lines = [line for line in file_mif.split('\n') if line]
+        # Кэш разобранных полей заголовка
+        self._columns = None
+        self._description = None
+        self._delimiter = None
+        # Индекс строк по первому слову: { "VERSION": [(line_num, attrs, line_text), ...] }
+        self._by_head = {}
+        by_head = self._by_head
+        for i, line in enumerate(self.lines):
+            # Ключевые слова начинаются с буквы: строки координат и строки
+            # с отступом отбрасываются без лишних аллокаций
+            if not line[0].isalpha():
+                continue
+            parts = line.split(None, 1)
+            attrs = parts[1].lstrip(' ') if len(parts) > 1 else ''
+            by_head.setdefault(parts[0].upper(), []).append((i, attrs, line))
+        # Обработчики геометрии по типу объекта
+        self._parsers = {
+            "point": self.__parsePoint,
+            "line": self.__parseLine,
+            "pline": self.__parsePline,
+            "region": self.__parseRegion,
+            "arc": self.__parseArc,
+            "text": self.__parseText,
+            "rect": self.__parseRect,
+            "roundrect": self.__parseRoundrect,
+            "ellipse": self.__parseEllipse,
+            "multipoint": self.__parseMultipoint,
+            "collection": self.__parseCollection,
+            "none": self.__parseNone,
+        }
     
     def getVersion(self):
         """
@@ -80,25 +184,26 @@ class Mif:
         ----
         <list>: [..., { "name": %name%, "type" %type% }, ...]
         """
+        if self._columns is None:
+            self._columns = self.__readColumns()
+        return [{"name": col_name, "type": col_type} for col_name, col_type in self._columns]
+
+    def __readColumns(self):
+        """Parse COLUMNS into a tuple of (name, type) pairs"""
         columns = []
         info = self.getLineStarted("COLUMNS")
         if not info:
-            return []
+            return ()
         info = info[0]
         start = info['line_num'] + 1
         finish = start + int(info['attrs'])
         for i in range(start, finish):
-            line = self.lines[i]
-            if line[0] in ['\t', ' ']:
-                line = line[1:]
-            line = line.replace('\t', '').split(' ')
-            if line[0] in ['\t', ' ', '']:
-                line = line[1:]
+            line = self.lines[i].split()
             col_name = line[0]
             col_type = ''.join(line[1:])
 
-            columns.append({"name": col_name, "type": col_type})
-        return columns
+            columns.append((col_name, col_type))
+        return tuple(columns)
     
     def getDescription(self):
         """
@@ -108,10 +213,16 @@ class Mif:
         ----
         <list>: [..., { "name": %name%, "description" %description% }, ...]
         """
+        if self._description is None:
+            self._description = self.__readDescription()
+        return [{"name": col_name, "description": col_description} for col_name, col_description in self._description]
+
+    def __readDescription(self):
+        """Parse DESCRIPTION into a tuple of (name, description) pairs"""
         columns = []
         info = self.getLineStarted("DESCRIPTION")
         if not info:
-            return []
+            return ()
         info = info[0]
         start = info['line_num'] + 1
         finish = start + int(info['attrs'])
@@ -126,8 +237,8 @@ class Mif:
             if col_description[0] == '"' or col_description[0] == "'":
                 col_description = col_description[1:-1]
 
-            columns.append({"name": col_name, "description": col_description})
-        return columns
+            columns.append((col_name, col_description))
+        return tuple(columns)
 
     def getCoordSys(self):
         """
@@ -150,17 +261,21 @@ class Mif:
         ---
         <String>: "\\t"
         """
+        if self._delimiter is not None:
+            return self._delimiter
         info = self.getLineStarted("DELIMITER")
         if not info:
-            return "\t"
+            self._delimiter = "\t"
+            return self._delimiter
         delimiter = info[0]['attrs']
-        if delimiter[0] == delimiter[-1] and delimiter[0] in ['\'', '\"']:
+        if delimiter[0] == delimiter[-1] and delimiter[0] in ("\'", "\""):
             delimiter = delimiter[1:-1]
+        self._delimiter = delimiter
         return delimiter
     
     def getLineStarted(self, string):
         """
-        Returns all lines that starts with incoming argument
+        Returns all lines whose first word is incoming argument (case insensitive)
         Parameters
         ---
         string: <String>
@@ -174,17 +289,8 @@ class Mif:
             "line_text": <String> %CurrentLineString%
             }, ... ]
         """
-        string = str(string)
-        l = len(string)
-        return_lines = []
-        for i in xrange(len(self.lines)):
-            line = self.lines[i]
-            if line[:l].lower() == string.lower():
-                attrs = line[l:]
-                if attrs and attrs[0] == ' ':
-                    attrs = attrs[1:]
-                return_lines.append({"line_num": int(i), "attrs": attrs, "line_text": self.lines[i]})
-        return return_lines
+        return [{"line_num": i, "attrs": attrs, "line_text": line}
+                for i, attrs, line in self._by_head.get(str(string).upper(), [])]
     
     def getGeometry(self):
         """
@@ -201,86 +307,63 @@ class Mif:
         if not info:
             return None
         
-        info = info[0]
-        l = info['line_num'] + 1
-        m = len(self.lines)
+        data_start = info[0]['line_num']
 
-        geom_objects = []
-        types = ("point", "line", "pline", "region", "arc", "text", "rect", "roundrect", "ellipse", "multipoint", "collection", "none")
-        
         # Собираются все линии, с которых начинается геометрия
-        for line_num in range(l, m):
-            line = self.lines[line_num]
-            if line.lower().startswith(types):
-                geom_objects.append(line_num)
+        geom_objects = []
+        for geom_type in _GEOM_TYPES:
+            for line_num, _, _ in self._by_head.get(geom_type.upper(), []):
+                if line_num > data_start:
+                    geom_objects.append((line_num, geom_type))
+        geom_objects.sort()
         
         geom = []
-        for l in geom_objects:
-            line = self.lines[l].lower().split(' ')
-            parsers = {
-                "point": self.__parsePoint,
-                "line": self.__parseLine,
-                "pline": self.__parsePline,
-                "region": self.__parseRegion,
-                "arc": self.__parseArc,
-                "text": self.__parseText,
-                "rect": self.__parseRect,
-                "roundrect": self.__parseRoundrect,
-                "ellipse": self.__parseEllipse,
-                "multipoint": self.__parseMultipoint,
-                "collection": self.__parseCollection,
-                "none": self.__parseNone,
-            }
-            try:
-                func = parsers[line[0]](l)
-            except:
-                raise ValueError("Uknown data format %s at line %s" % (line[0], l))
-            geom.append(func)
+        for l, geom_type in geom_objects:
+            geom.append(self._parsers[geom_type](l))
         return geom
     
+    def _tok(self, line):
+        """Returns lowercased words of the line"""
+        return self.lines[line].lower().split()
+
     def __parsePoint(self, line):
         """Parse point"""
-        line_str = self.lines[line].lower().replace('\t', '').split(' ')
+        line_str = self._tok(line)
         geometry = line_str[1:]
         return { "type": "point", "geom": geometry }
     def __parseLine(self, line):
         """Parse line"""
-        line_str = self.lines[line].lower().replace('\t', '').split(' ')
+        line_str = self._tok(line)
         geometry = [line_str[1:3], line_str[3:5]]
         return { "type": "line", "geom": geometry }
     def __parsePline(self, line):
         """Parse poly line"""
-        line_str = self.lines[line].lower().replace('\t', '').split(' ')
+        line_str = self._tok(line)
         geom_len = 2
-        geometry = [[]]
         if len(line_str) > 1 and line_str[1]:
             geom_len = int(line_str[1])
         line += 1
-        for l in range(line, line + geom_len):
-            point = self.lines[l].replace('\t', '').split(' ')
-            geometry[0].append(point)
+        geometry = [_parse_points(self.lines[line:line + geom_len])]
         return { "type": "pline", "geom": geometry }
     def __parseRegion(self, line):
         """Parse region"""
-        line_str = self.lines[line].lower().replace('\t', '').split(' ')
+        line_str = self._tok(line)
         reg_count = int(line_str[1])
-        reg_len = None
+        lines_len = len(self.lines)
         geometry = []
-        for _ in xrange(reg_count):
-            for l in range(line, len(self.lines)):
-                try:
-                    reg_len = int(self.lines[l])
-                except:
-                    pass
-                else:
-                    line = l + 1
-                    break
+        line += 1
+        for _ in range(reg_count):
+            # Пропускаются строки до количества точек очередного полигона
+            while line < lines_len and not _INT_LINE_RE.match(self.lines[line]):
+                line += 1
+            if line >= lines_len:
+                return None
+            reg_len = int(self.lines[line])
             if not reg_len:
                 return None
-            geometry.append([])
-            for l in range(line, line + reg_len):
-                point = self.lines[l].replace('\t', '').split(' ')
-                geometry[-1].append(point)
+            line += 1
+            geometry.append(_parse_points(self.lines[line:line + reg_len]))
+            line += reg_len
         return { "type": "region", "geom": geometry, "reg_count": reg_count }
     def __parseArc(self, line): # TODO
         pass; return { "type": "arc", "geom": None }
@@ -294,48 +377,28 @@ class Mif:
         pass; return { "type": "ellipse", "geom": None }
     def __parseMultipoint(self, line):
         """Parse multipoint"""
-        line_str = self.lines[line].lower().replace('\t', '').split(' ')
+        line_str = self._tok(line)
         point_count = int(line_str[1])
         line += 1
-        geometry = []
-        for i in range(line, line + point_count):
-            point = self.lines[i].replace('\t', '').split(' ')
-            geometry.append(point)
+        geometry = _parse_points(self.lines[line:line + point_count])
         return { "type": "multipoint", "geom": geometry }
     def __parseCollection(self, line): # TODO
         """Parse geometry collection"""
-        line_str = self.lines[line].lower().replace('\t', '').split(' ')
+        line_str = self._tok(line)
         collection_arr = []
         collection_len = int(line_str[1])
         line += 1
-        types = ("point", "line", "pline", "region", "arc", "text", "rect", "roundrect", "ellipse", "multipoint", "collection")
         for l in range(line, len(self.lines)):
-            line_str = self.lines[l].lower().replace('\t', '')
-            if line_str.startswith(types):
-                collection_arr.append(l)
+            toks = self._tok(l)
+            if toks and toks[0] in _COLLECTION_TYPES:
+                collection_arr.append((l, toks[0]))
             if len(collection_arr) >= collection_len:
                 break
-        parsers = {
-            "point": self.__parsePoint,
-            "line": self.__parseLine,
-            "pline": self.__parsePline,
-            "region": self.__parseRegion,
-            "arc": self.__parseArc,
-            "text": self.__parseText,
-            "rect": self.__parseRect,
-            "roundrect": self.__parseRoundrect,
-            "ellipse": self.__parseEllipse,
-            "multipoint": self.__parseMultipoint,
-            "collection": self.__parseCollection,
-            "none": self.__parseNone,
-        }
         geom_return = []
-        for obj in collection_arr:
-            geom_type = self.lines[obj].lower().replace('\t', '').split(' ')[0]
-            try:
-                func = parsers[geom_type]
-            except:
-                raise ValueError("Uknown data format %s at line %s" % (line[0], l))
+        for obj, geom_type in collection_arr:
+            func = self._parsers.get(geom_type)
+            if func is None:
+                raise ValueError("Uknown data format %s at line %s" % (geom_type, obj))
             geom_return.append(func(obj))
         return { "type": "collection", "geom": geom_return }
     def __parseNone(self, line): # TODO
@@ -344,38 +407,118 @@ class Mif:
         
 
 
+# Преобразование значений mid файла по типу колонки из COLUMNS
+_MID_CONVERTERS = {
+    "INTEGER": int,
+    "SMALLINT": int,
+    "FLOAT": float,
+    "DECIMAL": float,
+}
+
 class Mid:
     # Функция инициализации класса
     # Принимает строку содержимого mid файла в file_mid
     def __init__(self, file_mid, file_mif):
         self.file_mid = file_mid
-        self.lines = file_mid.split('\n')
         self.mif = file_mif
         if not isinstance(file_mif, Mif):
             raise ValueError("'file_mif' argument must be a Mif() instance")
 
-    def data(self, soft = False):
-        columns = self.mif.getDescription() if self.mif.getDescription() else self.mif.getColumns()
-        key = 'description' if self.mif.getDescription() else 'name'
+    @property
+    def lines(self):
+        """Lines of the mid file, split from file_mid on each access"""
+        return self.file_mid.split('\n')
+
+    def data(self, soft = False, typed = False):
+        """
+        Returns mid file rows
+
+        Parameters
+        ---
+        soft: <Boolean>
+            do not raise if row length differs from columns count
+        typed: <Boolean>
+            convert numeric columns (Integer, Smallint, Float, Decimal) by COLUMNS types,
+            other values and empty or blank fields are left as strings;
+            raises ValueError naming the row and column if a value can't be converted
+
+        Returns
+        ---
+        <Dict>: { "count": <Integer>, "info": [ ..., [ ..., { "name": %name%, "value": %value% }, ... ], ... ] }
+        """
+        description = self.mif.getDescription()
+        columns = description if description else self.mif.getColumns()
+        key = 'description' if description else 'name'
         delimiter = self.mif.getDelimiter()
 
-        data = {"count": 0, "info": []}
+        names = [col[key] for col in columns]
+        converters = None
+        if typed:
+            converters = [_MID_CONVERTERS.get(col['type'].split('(')[0].upper()) for col in self.mif.getColumns()]
 
-        for line in self.lines:
-            if not line:
-                continue
-            data['info'].append([])
+        columns_len = len(names)
+
+        info = []
+        append = info.append
+        for line in _iter_nonblank_lines(self.file_mid):
             if line[-1] == '\t':
                 line = line[:-1]
             els = line.split(delimiter)
-            if len(els) != len(columns) and not soft:
+            if len(els) != columns_len and not soft:
                 raise ValueError("columns length is not equal to mid file data.\ncall this function with 'soft=True' argument")
-            for i in xrange(len(els)):
-                attr_name = columns[ i % len(els) ]
-                data['info'][-1].append( { "name": attr_name[key], "value": els[i] } )
-        data['count'] = len(data['info'])
+            if converters:
+                for i, (name, conv, value) in enumerate(zip(names, converters, els)):
+                    if conv is None or not value.strip():
+                        continue
+                    try:
+                        els[i] = conv(value)
+                    except ValueError:
+                        raise ValueError("Can't convert value %r of column %s at row %s" % (value, name, len(info)))
+            append([{"name": name, "value": value} for name, value in zip(names, els)])
+
+        data = {"count": len(info), "info": info}
         return data
 
+# Известные системы координат MapInfo и соответствующие им EPSG
+_PROJS = {
+    "Earth Projection 1, 104": {"epsg": 4326, "name": "WGS84 / Long/Lat"},
+    "Earth 1, 104": {"epsg": 4326, "name": "WGS84"},
+
+    "Earth Projection 8, 104, \"m\", 97.03333333333, 0, 1, 1250000, -5411057.63": {"epsg": 911001, "name": "MSK-38 - zone 1"},
+    "Earth Projection 8, 104, \"m\", 100.03333333333, 0, 1, 2250000, -5411057.63": {"epsg": 911002, "name": "MSK-38 - zone 2"},
+    "Earth Projection 8, 104, \"m\", 103.03333333333, 0, 1, 3250000, -5411057.63": {"epsg": 911003, "name": "MSK-38 - zone 3"},
+    "Earth Projection 8, 104, \"m\", 106.03333333333, 0, 1, 4250000, -5411057.63": {"epsg": 911004, "name": "MSK-38 - zone 4"},
+    "Earth Projection 8, 104, \"m\", 109.03333333333, 0, 1, 5250000, -5411057.63": {"epsg": 911005, "name": "MSK-38 - zone 5"},
+    "Earth Projection 8, 104, \"m\", 112.03333333333, 0, 1, 6250000, -5411057.63": {"epsg": 911006, "name": "MSK-38 - zone 6"},
+    "Earth Projection 8, 104, \"m\", 115.03333333333, 0, 1, 7250000, -5411057.63": {"epsg": 911007, "name": "MSK-38 - zone 7"},
+    "Earth Projection 8, 104, \"m\", 118.03333333333, 0, 1, 8250000, -5411057.63": {"epsg": 911008, "name": "MSK-38 - zone 8"},
+}
+
+_COORDSYS_RE = re.compile(r'^\s*(earth(?:\s+projection)?)\s+(.*?)(?:\s+bounds\b.*)?$', re.I)
+
+def _coordsys_key(coordSys):
+    """
+    Converts coord. system string into a hashable tuple that ignores case,
+    quotes, whitespace and float precision noise
+
+    For example:
+    ---
+    "Earth Projection 8, 104, \"m\", 97.03333333333, 0" -> ("earth projection", 8.0, 104.0, "m", 97.033333, 0.0)
+    """
+    match = _COORDSYS_RE.match(coordSys or '')
+    if not match:
+        return None
+    key = [' '.join(match.group(1).lower().split())]
+    for param in match.group(2).split(','):
+        param = param.strip().strip('\'"')
+        try:
+            key.append(round(float(param), 6))
+        except ValueError:
+            key.append(param.lower())
+    return tuple(key)
+
+_PROJS_BY_KEY = dict((_coordsys_key(coordSys), info) for coordSys, info in _PROJS.items())
+
 class CoordSys:
     """
     Перевод MapInfo системы координат в EPSG:
@@ -390,27 +533,8 @@ class CoordSys:
     String : coordSys - Система координат из файла
     """
     def __init__(self, coordSys):
-        self.__loadProjs()
-        try:
-            info = self.projs[coordSys]
-        except:
-            print coordSys
-            raise ValueError("Uknown coordsys")
-        else:
-            self.epsg = info['epsg']
-            self.name = info['name']
-        
-    def __loadProjs(self):
-        self.projs = {
-            "Earth Projection 1, 104": {"epsg": 4326, "name": "WGS84 / Long/Lat"},
-            "Earth 1, 104": {"epsg": 4326, "name": "WGS84"},
-            
-            "Earth Projection 8, 104, \"m\", 97.03333333333, 0, 1, 1250000, -5411057.63": {"epsg": 911001, "name": "MSK-38 - zone 1"},
-            "Earth Projection 8, 104, \"m\", 100.03333333333, 0, 1, 2250000, -5411057.63": {"epsg": 911002, "name": "MSK-38 - zone 2"},
-            "Earth Projection 8, 104, \"m\", 103.03333333333, 0, 1, 3250000, -5411057.63": {"epsg": 911003, "name": "MSK-38 - zone 3"},
-            "Earth Projection 8, 104, \"m\", 106.03333333333, 0, 1, 4250000, -5411057.63": {"epsg": 911004, "name": "MSK-38 - zone 4"},
-            "Earth Projection 8, 104, \"m\", 109.03333333333, 0, 1, 5250000, -5411057.63": {"epsg": 911005, "name": "MSK-38 - zone 5"},
-            "Earth Projection 8, 104, \"m\", 112.03333333333, 0, 1, 6250000, -5411057.63": {"epsg": 911006, "name": "MSK-38 - zone 6"},
-            "Earth Projection 8, 104, \"m\", 115.03333333333, 0, 1, 7250000, -5411057.63": {"epsg": 911007, "name": "MSK-38 - zone 7"},
-            "Earth Projection 8, 104, \"m\", 118.03333333333, 0, 1, 8250000, -5411057.63": {"epsg": 911008, "name": "MSK-38 - zone 8"},
-        }
\ No newline at end of file
+        info = _PROJS_BY_KEY.get(_coordsys_key(coordSys))
+        if info is None:
+            raise ValueError("Uknown coordsys %s" % coordSys)
+        self.epsg = info['epsg']
+        self.name = info['name']